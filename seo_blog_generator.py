@@ -2,7 +2,137 @@ import streamlit as st
 import anthropic
 import time
 import re
-from typing import Optional, Dict, Any
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+# セクション並列生成の最大同時実行数
+MAX_SECTION_CONCURRENCY = 8
+
+# ストリーミング受信中、この秒数チャンクが届かなければ中断する
+STREAM_IDLE_TIMEOUT = 30.0
+
+# 進捗表示に使う1セクションあたりの想定文字数
+SECTION_EXPECTED_CHARS = 1000
+
+# 生成結果の解析に使う正規表現
+_TITLE_LINE_RE = re.compile(r'^\s*([1-5])\.\s*(.+?)\s*$', re.M)
+_RECOMMENDED_RE = re.compile(r'\*\*推奨タイトル:\*\*\s*(.+?)(?:\n|$)')
+_INTRO_RE = re.compile(r'\*\*導入文:\*\*\s*(.+?)(?:\n|$)')
+_HEADING_RE = re.compile(r'^[ \t]*(##|###)[ \t]+(.+?)[ \t\r]*$', re.M)
+
+# 入力値の検証に使う正規表現と文字数の上限（API送信前に不正な入力を弾く）
+_SYMBOLS_ONLY_RE = re.compile(r'[\W_]+')
+_CONTROL_CHAR_RE = re.compile(r'[\x00-\x08\x0b-\x1f\x7f]')
+MAX_KEYWORD_LENGTH = 50
+MAX_SUB_KEYWORDS_LENGTH = 200
+MAX_APPROACH_LENGTH = 1000
+
+# セッション状態の初期値
+_SS_DEFAULTS = {
+    "generated_article": "",
+    "generation_completed": False,
+    "generated_titles": {},
+    "selected_title": "",
+    "generation_progress": 0
+}
+
+# ダウンロードファイル名に使えない空白（半角・全角）を置き換える変換表
+_FILENAME_TRANS = str.maketrans({' ': '_', '\u3000': '_'})
+
+# タイトル・構成の生成結果キャッシュの保持件数と有効期間（秒）
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL = 3600
+
+# APIキーごとに保持する生成器（HTTP接続プール）の上限数と有効期間（秒）
+GENERATOR_CACHE_SIZE = 16
+GENERATOR_CACHE_TTL = 3600
+
+# 全リクエスト共通の指示。先頭に固定で置き、プロンプトキャッシュで再利用する
+SYSTEM_PROMPT = """あなたはSEO対策に精通したプロのライターです。依頼内容に応じて、以下の要件と出力形式に従ってください。
+
+# タイトル候補の作成
+
+## タイトル作成要件
+- SEOを意識したキーワード配置
+- クリックされやすい魅力的なタイトル
+- 検索意図に合致した内容
+- 文字数は28-32文字程度を推奨
+- 数字や年号、記号の活用
+- 図解、画像、動画等の視覚要素は含めない（テキストのみの記事のため）
+- 実際に提供できる内容のみをタイトルに含める
+
+## 出力形式
+**タイトル候補:**
+1. [SEO最適化されたタイトル1]
+2. [SEO最適化されたタイトル2] 
+3. [SEO最適化されたタイトル3]
+4. [SEO最適化されたタイトル4]
+5. [SEO最適化されたタイトル5]
+
+**推奨タイトル:** [上記の中で最もSEO効果が高いと思われるタイトル]
+
+# 記事の目次・構成の作成
+
+## 構成要件
+- 導入文（読者の関心を引く）
+- 本文セクション（H2見出し）を6-10個程度
+- 各セクションにH3サブセクションを2-3個含める
+- まとめ・結論部分
+- SEO効果の高い見出し構成
+
+## 出力形式
+**導入文:** [読者の関心を引く導入文・120-160文字程度]
+
+**記事構成:**
+## 1. [H2見出し1]
+### 1-1. [H3サブ見出し1-1]
+### 1-2. [H3サブ見出し1-2]
+
+## 2. [H2見出し2]
+### 2-1. [H3サブ見出し2-1]
+### 2-2. [H3サブ見出し2-2]
+### 2-3. [H3サブ見出し2-3]
+
+## 3. [H2見出し3]
+### 3-1. [H3サブ見出し3-1]
+### 3-2. [H3サブ見出し3-2]
+
+...
+
+## まとめ
+### まとめの要点1
+### まとめの要点2
+
+# 記事セクションの執筆
+
+## 執筆要件
+- セクション全体で600-1000文字程度
+- 各サブセクションを詳しく解説
+- 具体例、手順、tips等を豊富に含める
+- 読者が実際に行動できる実践的な情報
+- 専門的な内容も分かりやすく説明
+- SEOキーワードを自然に含める
+- 図表や画像の代わりに、詳細な文字による説明を提供
+- 視覚的要素が必要な場合は「図表のイメージ」として文字で説明
+
+## 出力形式
+## [セクションタイトル]
+
+### [サブセクション1]
+[詳細な内容・具体例・手順等]
+
+### [サブセクション2]  
+[詳細な内容・具体例・手順等]
+
+### [サブセクション3（あれば）]
+[詳細な内容・具体例・手順等]
+"""
 
 # ページ設定
 st.set_page_config(
@@ -13,7 +143,7 @@ st.set_page_config(
 )
 
 # カスタムCSS
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         text-align: center;
@@ -61,11 +191,119 @@ st.markdown("""
         margin: 1em 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# ヘッダー・フッターのHTML
+HEADER_HTML = """
+<h1 class="main-header">📝 SEO記事生成ツール</h1>
+<p class="sub-header">初心者でも簡単にSEO対応のブログ記事を生成できます</p>
+"""
+
+FOOTER_HTML = """
+---
+
+<div style="text-align: center; color: #666; font-size: 0.9em;">
+<p>SEO記事生成ツール | Powered by Anthropic Claude API</p>
+<p>⚠️ 生成された記事は必ず内容を確認してからご利用ください</p>
+</div>
+"""
+
+def normalize_text(text: str) -> str:
+    """全角・半角、大文字・小文字、空白の揺れを吸収した比較用の文字列を返す"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+
+class ResponseCache:
+    """生成結果を保持するスレッドセーフなLRUキャッシュ"""
+    
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """入力値を正規化してキャッシュキーを作成"""
+        payload = json.dumps([normalize_text(part) for part in parts], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """全セッションで共有する生成結果キャッシュ"""
+    return ResponseCache()
+
+class OutlineParser:
+    """ストリーミング中の構成を逐次解析し、H3まで確定したH2セクションを返す"""
+    
+    def __init__(self):
+        self._pending = ""
+        self._current_section = None
+    
+    def feed(self, text: str) -> list:
+        """受信したテキストを追加し、新たに確定したセクションを返す"""
+        self._pending += text
+        end = self._pending.rfind('\n') + 1
+        if not end:
+            return []
+        lines, self._pending = self._pending[:end], self._pending[end:]
+        return self._parse(lines)
+    
+    def close(self) -> list:
+        """残りのテキストを解析し、末尾のセクションも確定させて返す"""
+        completed = self._parse(self._pending)
+        self._pending = ""
+        if self._current_section:
+            completed.append(self._current_section)
+            self._current_section = None
+        return completed
+    
+    def _parse(self, lines: str) -> list:
+        completed = []
+        for match in _HEADING_RE.finditer(lines):
+            level, heading = match.groups()
+            
+            # H2見出しを検出（次のH2が現れた時点で直前のセクションが確定する）
+            if len(level) == 2:
+                if self._current_section:
+                    completed.append(self._current_section)
+                # まとめは本文セクションとして生成しない（配下のH3も含めて除外）
+                if heading.startswith('まとめ'):
+                    self._current_section = None
+                else:
+                    self._current_section = {
+                        'title': heading,
+                        'subsections': []
+                    }
+            
+            # H3見出しを検出
+            elif self._current_section:
+                self._current_section['subsections'].append(heading)
+        return completed
 
 class SEOBlogGenerator:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key
+        # キャッシュはプロセス全体で共有されるため、APIキーのハッシュでキーの範囲を分ける
+        self.cache_scope = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
         self.client = None
         if api_key:
             try:
@@ -73,12 +311,67 @@ class SEOBlogGenerator:
             except Exception as e:
                 st.error(f"API初期化エラー: {str(e)}")
     
-    def validate_inputs(self, keyword: str, genre: str, target_audience: str) -> Dict[str, Any]:
-        """入力値の検証"""
-        errors = []
+    def _stream_message(self, placeholder=None, on_text: Optional[Callable[[str], None]] = None,
+                        **params) -> str:
+        """ストリーミングでメッセージを受信し、受信したテキストを逐次描画する"""
+        chunks = []
+        # 読み取りタイムアウトはチャンク受信ごとにリセットされるため、無応答の検知に使える
+        with self.client.messages.stream(
+            timeout=anthropic.Timeout(STREAM_IDLE_TIMEOUT, connect=10.0),
+            **params
+        ) as stream:
+            for text in stream.text_stream:
+                chunks.append(text)
+                if placeholder is not None:
+                    placeholder.markdown("".join(chunks))
+                if on_text is not None:
+                    on_text(text)
+        return "".join(chunks)
+    
+    async def _stream_message_async(self, aclient: anthropic.AsyncAnthropic, placeholder=None,
+                                    on_text: Optional[Callable[[str], None]] = None,
+                                    **params) -> str:
+        """_stream_messageの非同期版（非同期クライアントでストリーミング受信する）"""
+        chunks = []
+        async with aclient.messages.stream(
+            timeout=anthropic.Timeout(STREAM_IDLE_TIMEOUT, connect=10.0),
+            **params
+        ) as stream:
+            async for text in stream.text_stream:
+                chunks.append(text)
+                if placeholder is not None:
+                    placeholder.markdown("".join(chunks))
+                if on_text is not None:
+                    on_text(text)
+        return "".join(chunks)
+    
+    def _system_blocks(self, *extra_texts: str) -> list:
+        """共通指示（と呼び出しごとに共有される文脈）をキャッシュ対象のsystemブロックとして組み立てる"""
+        return [
+            {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+            for text in (SYSTEM_PROMPT, *extra_texts)
+        ]
+    
+    @staticmethod
+    def validate_keyword(keyword: str) -> list:
+        """メインキーワードの検証"""
+        keyword = (keyword or "").strip()
         
-        if not keyword or len(keyword.strip()) < 2:
-            errors.append("メインキーワードは2文字以上で入力してください")
+        if len(keyword) < 2:
+            return ["メインキーワードは2文字以上で入力してください"]
+        if len(keyword) > MAX_KEYWORD_LENGTH:
+            return [f"メインキーワードは{MAX_KEYWORD_LENGTH}文字以内で入力してください"]
+        if _SYMBOLS_ONLY_RE.fullmatch(keyword):
+            return ["メインキーワードに記号以外の文字を含めてください"]
+        if _CONTROL_CHAR_RE.search(keyword):
+            return ["メインキーワードに使用できない文字が含まれています"]
+        return []
+    
+    @staticmethod
+    def validate_inputs(keyword: str, genre: str, target_audience: str,
+                        sub_keywords: str = "", specific_approach: str = "") -> Dict[str, Any]:
+        """入力値の検証"""
+        errors = SEOBlogGenerator.validate_keyword(keyword)
         
         if not genre:
             errors.append("記事のジャンルを選択してください")
@@ -86,72 +379,96 @@ class SEOBlogGenerator:
         if not target_audience:
             errors.append("想定読者層を選択してください")
         
+        if len(sub_keywords) > MAX_SUB_KEYWORDS_LENGTH:
+            errors.append(f"サブキーワードは{MAX_SUB_KEYWORDS_LENGTH}文字以内で入力してください")
+        
+        if len(specific_approach) > MAX_APPROACH_LENGTH:
+            errors.append(f"特定の観点やアプローチは{MAX_APPROACH_LENGTH}文字以内で入力してください")
+        
         return {
             "is_valid": len(errors) == 0,
             "errors": errors
         }
     
-    def generate_titles(self, keyword: str, genre: str = "", target_audience: str = "") -> Optional[str]:
-        """タイトル候補のみを生成"""
-        if not self.client:
-            return None
-        
+    def _titles_params(self, keyword: str, genre: str = "", target_audience: str = "") -> Dict[str, Any]:
+        """タイトル生成リクエストのパラメータを組み立てる"""
         genre_text = f"- ジャンル: {genre}\n" if genre else ""
         audience_text = f"- 想定読者: {target_audience}\n" if target_audience else ""
         
         prompt = f"""
-あなたはSEO対策に精通したプロのライターです。以下のキーワードに基づいて、SEO最適化されたタイトル候補を5つ作成してください。
+以下のキーワードに基づいて、SEO最適化されたタイトル候補を5つ作成してください。
 
 ## 条件
 - メインキーワード: {keyword}
 {genre_text}{audience_text}
-
-## タイトル作成要件
-- SEOを意識したキーワード配置
-- クリックされやすい魅力的なタイトル
-- 検索意図に合致した内容
-- 文字数は28-32文字程度を推奨
-- 数字や年号、記号の活用
-- 図解、画像、動画等の視覚要素は含めない（テキストのみの記事のため）
-- 実際に提供できる内容のみをタイトルに含める
-
-## 出力形式
-**タイトル候補:**
-1. [SEO最適化されたタイトル1]
-2. [SEO最適化されたタイトル2] 
-3. [SEO最適化されたタイトル3]
-4. [SEO最適化されたタイトル4]
-5. [SEO最適化されたタイトル5]
-
-**推奨タイトル:** [上記の中で最もSEO効果が高いと思われるタイトル]
-
 タイトル候補を作成してください。
 """
         
+        return {
+            "model": "claude-3-5-sonnet-20241022",
+            "max_tokens": 1000,
+            "temperature": 0.7,
+            "system": self._system_blocks(),
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        }
+    
+    def generate_titles(self, keyword: str, genre: str = "", target_audience: str = "",
+                        placeholder=None) -> Optional[str]:
+        """タイトル候補のみを生成"""
+        if not self.client:
+            return None
+        
+        cache = get_response_cache()
+        cache_key = cache.make_key(self.cache_scope, "titles", keyword, genre, target_audience)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = self._stream_message(
+                placeholder=placeholder,
+                **self._titles_params(keyword, genre, target_audience)
+            )
+            if response:
+                cache.put(cache_key, response)
+            return response
+        except Exception as e:
+            st.error(f"タイトル生成エラー: {str(e)}")
+            return None
+    
+    async def _gen_titles_async(self, aclient: anthropic.AsyncAnthropic, keyword: str,
+                                genre: str = "", target_audience: str = "") -> Optional[str]:
+        """generate_titlesの非同期版（記事生成と並行してタイトル候補を生成する）"""
+        cache = get_response_cache()
+        cache_key = cache.make_key(self.cache_scope, "titles", keyword, genre, target_audience)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=1000,
-                temperature=0.7,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            response = await self._stream_message_async(
+                aclient,
+                **self._titles_params(keyword, genre, target_audience)
             )
-            return response.content[0].text
+            if response:
+                cache.put(cache_key, response)
+            return response
         except Exception as e:
             st.error(f"タイトル生成エラー: {str(e)}")
             return None
     
-    def extract_titles_only(self, response: str) -> Dict[str, Any]:
+    @staticmethod
+    def extract_titles_only(response: str) -> Dict[str, Any]:
         """タイトル候補のみを抽出"""
-        title_candidates = []
-        for i in range(1, 6):
-            pattern = rf'{i}\.\s*(.+?)(?:\n|$)'
-            match = re.search(pattern, response)
-            if match:
-                title_candidates.append(match.group(1).strip())
-        
-        recommended_match = re.search(r'\*\*推奨タイトル:\*\*\s*(.+?)(?:\n|$)', response)
+        # 1回の走査で番号ごとに最初のタイトルを拾い、番号順に並べる
+        numbered_titles = {}
+        for match in _TITLE_LINE_RE.finditer(response):
+            numbered_titles.setdefault(int(match.group(1)), match.group(2).strip())
+        title_candidates = [numbered_titles[i] for i in sorted(numbered_titles)]
+        
+        recommended_match = _RECOMMENDED_RE.search(response)
         recommended_title = recommended_match.group(1).strip() if recommended_match else ""
         
         return {
@@ -159,13 +476,10 @@ class SEOBlogGenerator:
             "recommended_title": recommended_title
         }
     
-    def generate_outline(self, keyword: str, genre: str, target_audience: str, 
+    def _outline_params(self, keyword: str, genre: str, target_audience: str,
                         sub_keywords: str = "", article_length: str = "標準",
-                        specific_approach: str = "") -> Optional[str]:
-        """記事の目次・構成を生成"""
-        if not self.client:
-            return None
-        
+                        specific_approach: str = "") -> Dict[str, Any]:
+        """構成生成リクエストのパラメータを組み立てる"""
         length_guide = {
             "短め": "2000-3000文字程度（5-6セクション）",
             "標準": "3000-5000文字程度（6-8セクション）", 
@@ -173,7 +487,7 @@ class SEOBlogGenerator:
         }
         
         prompt = f"""
-あなたはSEO対策に精通したプロのライターです。以下の条件に基づいて、詳細な記事の目次・構成を作成してください。
+以下の条件に基づいて、詳細な記事の目次・構成を作成してください。
 
 ## 作成条件
 - メインキーワード: {keyword}
@@ -189,63 +503,55 @@ class SEOBlogGenerator:
             prompt += f"- 特定の観点: {specific_approach}\n"
         
         prompt += """
-## 構成要件
-- 導入文（読者の関心を引く）
-- 本文セクション（H2見出し）を6-10個程度
-- 各セクションにH3サブセクションを2-3個含める
-- まとめ・結論部分
-- SEO効果の高い見出し構成
-
-## 出力形式
-**導入文:** [読者の関心を引く導入文・120-160文字程度]
-
-**記事構成:**
-## 1. [H2見出し1]
-### 1-1. [H3サブ見出し1-1]
-### 1-2. [H3サブ見出し1-2]
-
-## 2. [H2見出し2]
-### 2-1. [H3サブ見出し2-1]
-### 2-2. [H3サブ見出し2-2]
-### 2-3. [H3サブ見出し2-3]
-
-## 3. [H2見出し3]
-### 3-1. [H3サブ見出し3-1]
-### 3-2. [H3サブ見出し3-2]
-
-...
-
-## まとめ
-### まとめの要点1
-### まとめの要点2
-
 詳細な構成を作成してください。
 """
         
+        return {
+            "model": "claude-3-5-sonnet-20241022",
+            "max_tokens": 2000,
+            "temperature": 0.7,
+            "system": self._system_blocks(),
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        }
+    
+    async def _gen_outline_async(self, aclient: anthropic.AsyncAnthropic, keyword: str, genre: str,
+                                 target_audience: str, sub_keywords: str = "", article_length: str = "標準",
+                                 specific_approach: str = "", placeholder=None,
+                                 on_text: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """記事の目次・構成を生成"""
+        cache = get_response_cache()
+        cache_key = cache.make_key(self.cache_scope, "outline", keyword, genre, target_audience,
+                                   sub_keywords, article_length, specific_approach)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if on_text is not None:
+                on_text(cached)
+            return cached
+        
         try:
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2000,
-                temperature=0.7,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            response = await self._stream_message_async(
+                aclient,
+                placeholder=placeholder,
+                on_text=on_text,
+                **self._outline_params(keyword, genre, target_audience,
+                                       sub_keywords, article_length, specific_approach)
             )
-            return response.content[0].text
+            if response:
+                cache.put(cache_key, response)
+            return response
         except Exception as e:
             st.error(f"構成生成エラー: {str(e)}")
             return None
     
-    def generate_section(self, keyword: str, section_title: str, subsections: list, 
-                        context: str = "") -> Optional[str]:
-        """個別セクションを詳細に生成"""
-        if not self.client:
-            return None
-        
+    def _section_params(self, keyword: str, section_title: str, subsections: list,
+                        context: str = "") -> Dict[str, Any]:
+        """セクション生成リクエストのパラメータを組み立てる"""
         subsection_text = "\n".join([f"- {sub}" for sub in subsections])
         
         prompt = f"""
-あなたはSEO対策に精通したプロのライターです。以下の条件に基づいて、記事の1つのセクションを詳細に執筆してください。
+以下の条件に基づいて、記事の1つのセクションを詳細に執筆してください。
 
 ## 執筆条件
 - メインキーワード: {keyword}
@@ -253,107 +559,146 @@ class SEOBlogGenerator:
 - サブセクション:
 {subsection_text}
 
-## 記事の文脈
-{context}
-
-## 執筆要件
-- セクション全体で600-1000文字程度
-- 各サブセクションを詳しく解説
-- 具体例、手順、tips等を豊富に含める
-- 読者が実際に行動できる実践的な情報
-- 専門的な内容も分かりやすく説明
-- SEOキーワードを自然に含める
-- 図表や画像の代わりに、詳細な文字による説明を提供
-- 視覚的要素が必要な場合は「図表のイメージ」として文字で説明
-
-## 出力形式
-## {section_title}
-
-### [サブセクション1]
-[詳細な内容・具体例・手順等]
-
-### [サブセクション2]  
-[詳細な内容・具体例・手順等]
-
-### [サブセクション3（あれば）]
-[詳細な内容・具体例・手順等]
-
 セクションを執筆してください。
 """
         
+        return {
+            "model": "claude-3-5-sonnet-20241022",
+            "max_tokens": 3000,
+            "temperature": 0.7,
+            # 記事の文脈は全セクションで共通なので、共通指示に続けてキャッシュする
+            "system": self._system_blocks(f"## 記事の文脈\n{context}") if context else self._system_blocks(),
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        }
+    
+    async def _gen_section_async(self, aclient: anthropic.AsyncAnthropic, keyword: str,
+                                 section_title: str, subsections: list, context: str = "",
+                                 on_text: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """個別セクションを詳細に生成"""
         try:
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=3000,
-                temperature=0.7,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            return await self._stream_message_async(
+                aclient,
+                on_text=on_text,
+                **self._section_params(keyword, section_title, subsections, context)
             )
-            return response.content[0].text
         except Exception as e:
             st.error(f"セクション生成エラー: {str(e)}")
             return None
     
-    def extract_outline_structure(self, outline: str) -> Dict[str, Any]:
-        """構成から見出し構造を抽出"""
+    async def _generate_article_async(self, keyword: str, genre: str, target_audience: str,
+                                      sub_keywords: str, article_length: str, specific_approach: str,
+                                      context: str, with_titles: bool = False, outline_placeholder=None,
+                                      on_section_start: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                                      on_text: Optional[Callable[[int, str], None]] = None,
+                                      on_done: Optional[Callable[[int, Optional[str]], None]] = None
+                                      ) -> Optional[Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(MAX_SECTION_CONCURRENCY)
         sections = []
-        current_section = None
+        tasks = []
+        titles_response = None
         
-        lines = outline.split('\n')
-        for line in lines:
-            line = line.strip()
+        # 非同期クライアントは実行中のイベントループに紐づくため、asyncio.run()ごとに作成する
+        async with anthropic.AsyncAnthropic(api_key=self.api_key) as aclient:
+            async def generate(index: int, section: Dict[str, Any]) -> Optional[str]:
+                async with semaphore:
+                    content = await self._gen_section_async(
+                        aclient,
+                        keyword,
+                        section['title'],
+                        section['subsections'],
+                        context,
+                        on_text=(lambda text: on_text(index, text)) if on_text else None
+                    )
+                if on_done is not None:
+                    on_done(index, content)
+                return content
             
-            # H2見出しを検出
-            if line.startswith('## ') and not line.startswith('## まとめ'):
-                if current_section:
-                    sections.append(current_section)
-                current_section = {
-                    'title': line.replace('## ', ''),
-                    'subsections': []
-                }
+            def dispatch(completed_sections: list):
+                # H3まで確定したセクションから、構成の完了を待たずに生成を開始する
+                for section in completed_sections:
+                    index = len(sections)
+                    sections.append(section)
+                    if on_section_start is not None:
+                        on_section_start(index, section)
+                    tasks.append(asyncio.create_task(generate(index, section)))
             
-            # H3見出しを検出
-            elif line.startswith('### ') and current_section:
-                current_section['subsections'].append(line.replace('### ', ''))
-        
-        # 最後のセクションを追加
-        if current_section:
-            sections.append(current_section)
-        
-        # 導入文を抽出
-        intro_match = re.search(r'\*\*導入文:\*\*\s*(.+?)(?:\n|$)', outline)
-        intro = intro_match.group(1).strip() if intro_match else ""
+            # タイトル未選択の場合は、依存関係のないタイトル生成を構成生成と並行して行う
+            if with_titles:
+                tasks.append(asyncio.create_task(
+                    self._gen_titles_async(aclient, keyword, genre, target_audience)
+                ))
+            
+            parser = OutlineParser()
+            try:
+                outline = await self._gen_outline_async(
+                    aclient, keyword, genre, target_audience,
+                    sub_keywords, article_length, specific_approach,
+                    placeholder=outline_placeholder,
+                    on_text=lambda text: dispatch(parser.feed(text))
+                )
+                if not outline:
+                    return None
+                dispatch(parser.close())
+                
+                results = await asyncio.gather(*tasks)
+                if with_titles:
+                    titles_response, results = results[0], results[1:]
+            finally:
+                for task in tasks:
+                    task.cancel()
         
+        intro_match = _INTRO_RE.search(outline)
         return {
-            'intro': intro,
-            'sections': sections
+            'outline': outline,
+            'intro': intro_match.group(1).strip() if intro_match else "",
+            'sections': sections,
+            'sections_content': results,
+            'titles': titles_response
         }
     
-    def extract_title_and_meta(self, article: str) -> Dict[str, str]:
+    def generate_article(self, keyword: str, genre: str, target_audience: str,
+                         sub_keywords: str = "", article_length: str = "標準",
+                         specific_approach: str = "", context: str = "", with_titles: bool = False,
+                         outline_placeholder=None,
+                         on_section_start: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                         on_text: Optional[Callable[[int, str], None]] = None,
+                         on_done: Optional[Callable[[int, Optional[str]], None]] = None
+                         ) -> Optional[Dict[str, Any]]:
+        """構成をストリーミング生成し、確定したセクションから並列に本文を生成する"""
+        if not self.client:
+            return None
+        
+        return asyncio.run(self._generate_article_async(
+            keyword, genre, target_audience, sub_keywords, article_length, specific_approach,
+            context, with_titles, outline_placeholder, on_section_start, on_text, on_done
+        ))
+    
+    @staticmethod
+    def extract_title_and_meta(article: str) -> Dict[str, str]:
         """導入文の抽出"""
         # 導入文を抽出
-        intro_match = re.search(r'\*\*導入文:\*\*\s*(.+?)(?:\n|$)', article)
+        intro_match = _INTRO_RE.search(article)
         intro = intro_match.group(1).strip() if intro_match else "導入文が見つかりません"
         
         return {"intro": intro}
 
+# 接続プールが再利用されるのは同期クライアントを使うタイトル生成ボタンのみ。
+# 記事生成は非同期クライアントを記事ごとに作成し、その記事内の全リクエストで接続を共有する。
+@st.cache_resource(max_entries=GENERATOR_CACHE_SIZE, ttl=GENERATOR_CACHE_TTL)
+def get_generator(api_key: str) -> SEOBlogGenerator:
+    """APIキーごとに生成器を使い回す"""
+    return SEOBlogGenerator(api_key)
+
 def main():
-    # ヘッダー
-    st.markdown('<h1 class="main-header">📝 SEO記事生成ツール</h1>', unsafe_allow_html=True)
-    st.markdown('<p class="sub-header">初心者でも簡単にSEO対応のブログ記事を生成できます</p>', unsafe_allow_html=True)
+    # CSSとヘッダー（再実行ごとに描画されない要素は消えるため、毎回まとめて1回で描画する）
+    st.markdown(CUSTOM_CSS + HEADER_HTML, unsafe_allow_html=True)
     
     # セッション状態の初期化
-    if 'generated_article' not in st.session_state:
-        st.session_state.generated_article = ""
-    if 'generation_completed' not in st.session_state:
-        st.session_state.generation_completed = False
-    if 'generated_titles' not in st.session_state:
-        st.session_state.generated_titles = {}
-    if 'selected_title' not in st.session_state:
-        st.session_state.selected_title = ""
-    if 'generation_progress' not in st.session_state:
-        st.session_state.generation_progress = 0
+    for key, value in _SS_DEFAULTS.items():
+        # 可変な初期値をセッション間で共有しないよう、セッションごとに複製する
+        st.session_state.setdefault(key, copy.copy(value))
     
     # サイドバーでAPI Key設定
     with st.sidebar:
@@ -397,107 +742,117 @@ def main():
         </div>
         """, unsafe_allow_html=True)
         
-        # 必須項目
-        st.subheader("必須項目")
-        keyword = st.text_input(
-            "メインキーワード *",
-            placeholder="例: Python プログラミング",
-            help="記事のメインとなるキーワードを入力してください"
-        )
-        
-        genre = st.selectbox(
-            "記事のジャンル/カテゴリ *",
-            options=["", "技術・プログラミング", "ビジネス", "ライフスタイル", "健康・美容", 
-                    "教育・学習", "エンターテイメント", "旅行", "料理・グルメ", "ファッション", "その他"],
-            help="記事のジャンルを選択してください"
-        )
-        
-        target_audience = st.selectbox(
-            "想定読者層 *",
-            options=["", "初心者", "中級者", "上級者", "専門家", "一般向け"],
-            help="記事を読む対象者を選択してください"
-        )
-        
-        # タイトル生成ボタン
-        if st.button("🎯 タイトル候補を生成", use_container_width=True):
-            if not api_key:
-                st.error("APIキーを入力してください")
-            elif not keyword or len(keyword.strip()) < 2:
-                st.error("メインキーワードは2文字以上で入力してください")
-            else:
-                generator = SEOBlogGenerator(api_key)
-                with st.spinner("タイトル候補を生成中..."):
-                    titles_response = generator.generate_titles(keyword, genre, target_audience)
-                    if titles_response:
-                        st.session_state.generated_titles = generator.extract_titles_only(titles_response)
-                        st.success("タイトル候補が生成されました！")
-                    else:
-                        st.error("タイトル生成に失敗しました。APIキーを確認してください。")
-        
-        # タイトル候補の表示
-        if 'generated_titles' in st.session_state and st.session_state.generated_titles:
-            st.subheader("🎯 生成されたタイトル候補")
-            titles_data = st.session_state.generated_titles
+        # 入力中の再実行を避けるため、入力欄はフォームにまとめて送信時にのみ反映する
+        with st.form("article_inputs"):
+            # 必須項目
+            st.subheader("必須項目")
+            keyword = st.text_input(
+                "メインキーワード *",
+                placeholder="例: Python プログラミング",
+                help="記事のメインとなるキーワードを入力してください"
+            ).strip()
             
-            if titles_data["title_candidates"]:
-                # タイトル候補を表示
-                st.write("**以下から記事のタイトルを選択してください：**")
-                
-                # ラジオボタンでタイトル選択
-                title_options = []
-                for i, title in enumerate(titles_data["title_candidates"], 1):
-                    title_options.append(f"{i}. {title}")
+            genre = st.selectbox(
+                "記事のジャンル/カテゴリ *",
+                options=["", "技術・プログラミング", "ビジネス", "ライフスタイル", "健康・美容", 
+                        "教育・学習", "エンターテイメント", "旅行", "料理・グルメ", "ファッション", "その他"],
+                help="記事のジャンルを選択してください"
+            )
+            
+            target_audience = st.selectbox(
+                "想定読者層 *",
+                options=["", "初心者", "中級者", "上級者", "専門家", "一般向け"],
+                help="記事を読む対象者を選択してください"
+            )
+            
+            # タイトル生成ボタン
+            if st.form_submit_button("🎯 タイトル候補を生成", use_container_width=True):
+                keyword_errors = SEOBlogGenerator.validate_keyword(keyword)
+                if not api_key:
+                    st.error("APIキーを入力してください")
+                elif keyword_errors:
+                    for error in keyword_errors:
+                        st.error(error)
+                else:
+                    generator = get_generator(api_key)
+                    with st.spinner("タイトル候補を生成中..."):
+                        preview = st.empty()
+                        titles_response = generator.generate_titles(keyword, genre, target_audience, preview)
+                        preview.empty()
+                        if titles_response:
+                            st.session_state.generated_titles = SEOBlogGenerator.extract_titles_only(titles_response)
+                            st.success("タイトル候補が生成されました！")
+                        else:
+                            st.error("タイトル生成に失敗しました。APIキーを確認してください。")
+            
+            # タイトル候補の表示
+            if 'generated_titles' in st.session_state and st.session_state.generated_titles:
+                st.subheader("🎯 生成されたタイトル候補")
+                titles_data = st.session_state.generated_titles
                 
-                if title_options:
-                    selected_title_index = st.radio(
-                        "タイトルを選択:",
-                        range(len(title_options)),
-                        format_func=lambda x: title_options[x],
-                        key="title_selection"
-                    )
+                if titles_data["title_candidates"]:
+                    # タイトル候補を表示
+                    st.write("**以下から記事のタイトルを選択してください：**")
+                    
+                    # ラジオボタンでタイトル選択
+                    title_options = []
+                    for i, title in enumerate(titles_data["title_candidates"], 1):
+                        title_options.append(f"{i}. {title}")
                     
-                    # 選択されたタイトルを保存
-                    st.session_state.selected_title = titles_data["title_candidates"][selected_title_index]
+                    if title_options:
+                        selected_title_index = st.radio(
+                            "タイトルを選択:",
+                            range(len(title_options)),
+                            format_func=lambda x: title_options[x],
+                            key="title_selection"
+                        )
+                        
+                        # 選択されたタイトルを保存
+                        st.session_state.selected_title = titles_data["title_candidates"][selected_title_index]
+                        
+                        # 選択されたタイトルを強調表示
+                        st.success(f"**選択されたタイトル:** {st.session_state.selected_title}")
                     
-                    # 選択されたタイトルを強調表示
-                    st.success(f"**選択されたタイトル:** {st.session_state.selected_title}")
+                    # AI推奨タイトルも参考として表示
+                    if titles_data["recommended_title"]:
+                        st.info(f"💡 **AI推奨:** {titles_data['recommended_title']}")
                 
-                # AI推奨タイトルも参考として表示
-                if titles_data["recommended_title"]:
-                    st.info(f"💡 **AI推奨:** {titles_data['recommended_title']}")
+                st.markdown("---")
+            
+            # オプション項目
+            st.subheader("オプション項目")
+            sub_keywords = st.text_input(
+                "サブキーワード",
+                placeholder="例: 学習方法, 初心者向け",
+                help="関連するキーワードがあれば入力してください（カンマ区切り）"
+            ).strip()
             
-            st.markdown("---")
-        
-        # オプション項目
-        st.subheader("オプション項目")
-        sub_keywords = st.text_input(
-            "サブキーワード",
-            placeholder="例: 学習方法, 初心者向け",
-            help="関連するキーワードがあれば入力してください（カンマ区切り）"
-        )
-        
-        article_length = st.selectbox(
-            "記事の長さ",
-            options=["短め", "標準", "長め"],
-            index=1,
-            help="記事の長さを選択してください"
-        )
-        
-        specific_approach = st.text_area(
-            "特定の観点やアプローチ",
-            placeholder="例: 実践的な手順を重視、初心者向けの説明を充実",
-            help="記事で重視したい観点があれば入力してください"
-        )
+            article_length = st.selectbox(
+                "記事の長さ",
+                options=["短め", "標準", "長め"],
+                index=1,
+                help="記事の長さを選択してください"
+            )
+            
+            specific_approach = st.text_area(
+                "特定の観点やアプローチ",
+                placeholder="例: 実践的な手順を重視、初心者向けの説明を充実",
+                help="記事で重視したい観点があれば入力してください"
+            ).strip()
+            
+            # 生成ボタン
+            submitted = st.form_submit_button("🚀 記事を生成", type="primary", use_container_width=True)
         
         st.markdown('</div>', unsafe_allow_html=True)
         
-        # 生成ボタン
-        if st.button("🚀 記事を生成", type="primary", use_container_width=True):
+        if submitted:
             if not api_key:
                 st.error("APIキーを入力してください")
             else:
-                generator = SEOBlogGenerator(api_key)
-                validation = generator.validate_inputs(keyword, genre, target_audience)
+                generator = get_generator(api_key)
+                validation = SEOBlogGenerator.validate_inputs(
+                    keyword, genre, target_audience, sub_keywords, specific_approach
+                )
                 
                 if not validation["is_valid"]:
                     for error in validation["errors"]:
@@ -508,67 +863,112 @@ def main():
                     status_text = st.empty()
                     
                     try:
-                        # ステップ1: 構成生成
-                        status_text.text("ステップ1/4: 記事構成を生成中...")
-                        progress_bar.progress(25)
+                        # ステップ1: 構成生成（確定したセクションから順に、構成の完了を待たずに本文生成を開始する）
+                        status_text.text("ステップ1/3: 記事構成を生成中...")
+                        progress_bar.progress(10)
+                        
+                        preview = st.empty()
+                        section_list = st.container()
+                        
+                        # セクションごとの進捗行と、受信済みの文字数（トークン単位で進捗バーを更新する）
+                        sections = []
+                        section_rows = []
+                        received_chars = []
+                        progress_state = {"chars": 0, "completed": 0, "value": 10}
+                        
+                        def update_progress():
+                            ratio = min(progress_state["chars"] / (SECTION_EXPECTED_CHARS * len(sections)), 0.99)
+                            # セクション数が増えると比率が下がるため、進捗は戻さない
+                            progress_state["value"] = max(progress_state["value"], int(35 + 50 * ratio))
+                            progress_bar.progress(progress_state["value"])
+                        
+                        def on_section_start(index: int, section: Dict[str, Any]):
+                            sections.append(section)
+                            section_rows.append(section_list.empty())
+                            received_chars.append(0)
+                            section_rows[index].text(f"⏳ {section['title']}")
+                            status_text.text(f"ステップ2/3: セクションを詳細生成中（開始 {len(sections)}）...")
                         
-                        outline = generator.generate_outline(
-                            keyword, genre, target_audience, 
-                            sub_keywords, article_length, specific_approach
+                        def on_section_text(index: int, text: str):
+                            received_chars[index] += len(text)
+                            progress_state["chars"] += len(text)
+                            section_rows[index].text(f"✍️ {sections[index]['title']}（{received_chars[index]}文字）")
+                            update_progress()
+                        
+                        def on_section_done(index: int, content: Optional[str]):
+                            progress_state["completed"] += 1
+                            mark = "✅" if content else "⚠️"
+                            section_rows[index].text(f"{mark} {sections[index]['title']}")
+                            status_text.text(f"ステップ2/3: セクション {progress_state['completed']}/{len(sections)} を生成完了...")
+                        
+                        result = generator.generate_article(
+                            keyword, genre, target_audience,
+                            sub_keywords, article_length, specific_approach,
+                            context=f"記事テーマ: {keyword} ({genre})",
+                            with_titles=not st.session_state.selected_title,
+                            outline_placeholder=preview,
+                            on_section_start=on_section_start,
+                            on_text=on_section_text,
+                            on_done=on_section_done
                         )
+                        preview.empty()
+                        for row in section_rows:
+                            row.empty()
                         
-                        if not outline:
+                        if not result:
                             st.error("構成の生成に失敗しました。")
                             return
                         
-                        # ステップ2: 構成解析
-                        status_text.text("ステップ2/4: 構成を解析中...")
-                        progress_bar.progress(35)
-                        
-                        structure = generator.extract_outline_structure(outline)
-                        
-                        # ステップ3: セクションごとに生成
-                        status_text.text("ステップ3/4: セクションを詳細生成中...")
-                        sections_content = []
+                        structure = {'intro': result['intro'], 'sections': result['sections']}
                         
-                        total_sections = len(structure['sections'])
-                        for i, section in enumerate(structure['sections']):
-                            section_progress = 35 + (50 * (i + 1) / total_sections)
-                            progress_bar.progress(int(section_progress))
-                            status_text.text(f"ステップ3/4: セクション {i+1}/{total_sections} を生成中...")
-                            
-                            section_content = generator.generate_section(
-                                keyword, 
-                                section['title'], 
-                                section['subsections'],
-                                f"記事テーマ: {keyword} ({genre})"
-                            )
-                            
-                            if section_content:
-                                sections_content.append(section_content)
+                        # 並行生成したタイトル候補から推奨タイトルを記事のタイトルにする
+                        if result['titles']:
+                            titles_data = SEOBlogGenerator.extract_titles_only(result['titles'])
+                            candidates = titles_data["title_candidates"]
+                            recommended = titles_data["recommended_title"]
+                            # 表記揺れを吸収して候補と照合し、一致しない場合も推奨タイトルをそのまま使う
+                            normalized_candidates = [normalize_text(title) for title in candidates]
+                            normalized_recommended = normalize_text(recommended)
+                            if normalized_recommended and normalized_recommended in normalized_candidates:
+                                title_index = normalized_candidates.index(normalized_recommended)
+                                recommended = candidates[title_index]
+                            else:
+                                title_index = 0
+                                if not recommended and candidates:
+                                    recommended = candidates[0]
+                            st.session_state.generated_titles = titles_data
+                            st.session_state.selected_title = recommended
+                            # 次回の再実行でタイトル選択欄が同じタイトルを選択した状態で表示されるようにする
+                            st.session_state.title_selection = title_index
+                        sections_content = [content for content in result['sections_content'] if content]
                         
-                        # ステップ4: 記事統合
-                        status_text.text("ステップ4/4: 記事を統合中...")
+                        # ステップ3: 記事統合
+                        status_text.text("ステップ3/3: 記事を統合中...")
                         progress_bar.progress(95)
                         
-                        # 最終記事を統合
-                        final_article = f"**導入文:** {structure['intro']}\n\n"
-                        final_article += f"**記事本文:**\n\n"
+                        # 最終記事を統合（各要素をリストに集めて最後に一度だけ結合する）
+                        article_parts = [
+                            f"**導入文:** {structure['intro']}",
+                            "**記事本文:**"
+                        ]
                         
                         # 選択されたタイトルを使用
                         if 'selected_title' in st.session_state and st.session_state.selected_title:
-                            final_article += f"# {st.session_state.selected_title}\n\n"
+                            article_parts.append(f"# {st.session_state.selected_title}")
                         
-                        final_article += f"{structure['intro']}\n\n"
+                        article_parts.append(structure['intro'])
                         
                         # 各セクションを追加
-                        for content in sections_content:
-                            final_article += content + "\n\n"
+                        article_parts.extend(sections_content)
                         
                         # まとめを追加
-                        final_article += f"## まとめ\n\n"
-                        final_article += f"本記事では、{keyword}について詳しく解説しました。"
-                        final_article += f"各ポイントを実践することで、{target_audience}の方でも効果的に活用できるでしょう。"
+                        article_parts.append("## まとめ")
+                        article_parts.append(
+                            f"本記事では、{keyword}について詳しく解説しました。"
+                            f"各ポイントを実践することで、{target_audience}の方でも効果的に活用できるでしょう。"
+                        )
+                        
+                        final_article = "\n\n".join(article_parts)
                         
                         progress_bar.progress(100)
                         status_text.text("✅ 記事生成完了！")
@@ -596,8 +996,7 @@ def main():
             article = st.session_state.generated_article
             
             # タイトルとメタディスクリプションの抽出
-            generator = SEOBlogGenerator()
-            extracted = generator.extract_title_and_meta(article)
+            extracted = SEOBlogGenerator.extract_title_and_meta(article)
             
             # 記事情報の表示
             st.subheader("📋 記事情報")
@@ -617,31 +1016,31 @@ def main():
             # ダウンロード・コピー機能
             st.subheader("💾 ダウンロード・コピー")
             
+            # 2つのダウンロードボタンで同じバイト列を共有する
+            article_bytes = article.encode("utf-8")
+            file_stem = f"seo_article_{keyword.translate(_FILENAME_TRANS)}"
+            
             col_download1, col_download2 = st.columns(2)
             
             with col_download1:
                 st.download_button(
                     label="📄 テキスト形式でダウンロード",
-                    data=article,
-                    file_name=f"seo_article_{keyword.replace(' ', '_').replace('　', '_')}.txt",
+                    data=article_bytes,
+                    file_name=f"{file_stem}.txt",
                     mime="text/plain"
                 )
             
             with col_download2:
                 st.download_button(
                     label="📝 Markdown形式でダウンロード",
-                    data=article,
-                    file_name=f"seo_article_{keyword.replace(' ', '_').replace('　', '_')}.md",
+                    data=article_bytes,
+                    file_name=f"{file_stem}.md",
                     mime="text/markdown"
                 )
             
-            # コピー用テキストエリア
-            st.text_area(
-                "記事内容（コピー用）",
-                value=article,
-                height=200,
-                help="この欄から記事をコピーできます"
-            )
+            # コピー用（st.codeは状態を持たず、右上のボタンでコピーできる）
+            with st.expander("記事内容（コピー用）"):
+                st.code(article, language="markdown")
             
         else:
             st.info("左側の入力フォームに情報を入力して、「記事を生成」ボタンをクリックしてください。")
@@ -649,13 +1048,7 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
     
     # フッター
-    st.markdown("---")
-    st.markdown("""
-    <div style="text-align: center; color: #666; font-size: 0.9em;">
-    <p>SEO記事生成ツール | Powered by Anthropic Claude API</p>
-    <p>⚠️ 生成された記事は必ず内容を確認してからご利用ください</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(FOOTER_HTML, unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()